@@ -1,53 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
 
-import pandas as pd
 import polars as pl
+import polars.selectors as cs
 
 from explore_bqss.constants import DIR2DATA
 
+# Low-cardinality string columns, stored as categoricals. The metadata name takes the same values as the valeur key.
+CATEGORICAL_COLUMNS = ["key", "name", "source", "finess_type"]
 
+# Version of the cached parquet files, to bump whenever their schema changes so that stale caches are not read.
+CACHE_VERSION = 2
+
+
+def shrink_dtypes(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Downcast the integer columns to the smallest type holding their values and cast the low-cardinality string
+    columns to categorical.
+
+    Args:
+        df (pl.DataFrame): The dataset to shrink.
+
+    Returns:
+        pl.DataFrame: The dataset with smaller dtypes.
+    """
+    return df.with_columns(
+        cs.integer().shrink_dtype(),
+        *[pl.col(col).cast(pl.Categorical) for col in CATEGORICAL_COLUMNS if col in df.columns],
+    ).shrink_to_fit()
+
+
+@lru_cache(maxsize=1)
 def fetch_bqss_data(cache_dir: Path = DIR2DATA) -> dict:
     """
     Fetch the data from the data.gouv.fr website if not already in the cache_dir, otherwise fetch them from the cache_dir.
 
+    The result is kept in memory: calling it again with the same cache_dir returns the same dataframes.
+
     Args:
-        cache_dir (str, optional): _description_. Defaults to DIR2DATA.
+        cache_dir (Path, optional): Directory of the parquet cache. Defaults to DIR2DATA.
 
     Returns:
-        dict: _description_
+        dict: The datasets by name. "valeur" is a pl.LazyFrame scanning the parquet cache, call .collect() to load it;
+            "finess" and "metadata" are pl.DataFrame. Enable the polars string cache before the first call to join the
+            categorical columns of different datasets.
     """
     df_metadata = [
         {
             "df_name": "valeur",
             "url": "https://www.data.gouv.fr/fr/datasets/r/da295ccc-2011-4995-b810-ad1f1a82a83f",
+            "format": "csv",
+            # FINESS ids have leading zeros and letters for Corsica (eg. 2A), keep them as strings. Each row fills only
+            # one of the value columns: they are too sparse for their dtypes to be inferred from the first rows.
+            "schema_overrides": {
+                "finess": pl.String,
+                "value_boolean": pl.Boolean,
+                "value_string": pl.String,
+                "value_integer": pl.Int64,
+                "value_float": pl.Float64,
+                "value_date": pl.String,
+            },
         },
         {
             "df_name": "finess",
             "url": "https://www.data.gouv.fr/fr/datasets/r/b8ef14e5-4f98-4596-82ed-44881c65a0cc",
+            "format": "parquet",
         },
         {
             "df_name": "metadata",
             "url": "https://www.data.gouv.fr/fr/datasets/r/e56fb5a5-5a74-4507-ba77-e0411d4aa234",
+            "format": "csv",
         },
     ]
 
-    df_dict = {}
+    # Printed before the concurrent fetch so that the messages of the worker threads do not interleave.
     for df_metadata_dict in df_metadata:
-        df_name = df_metadata_dict["df_name"]
-        print(f"Fetching {df_name} data")
-        if df_name != "finess":
-            local_path = cache_dir / f"{df_name}.csv"
-            if not local_path.exists():
-                df = pd.read_csv(df_metadata_dict["url"], low_memory=False)
-                df.to_csv(local_path, index=False)
-            else:
-                df = pd.read_csv(local_path, low_memory=False)
-        else:
-            local_path = cache_dir / f"{df_name}.parquet"
-            if not local_path.exists():
-                df = pd.read_parquet(df_metadata_dict["url"])
-                df.to_parquet(local_path)
-            else:
-                df = pl.read_parquet(local_path)
-        df_dict[df_name] = df
+        print(f"Fetching {df_metadata_dict['df_name']} data")
+    # The datasets are independent: download or read them concurrently.
+    with ThreadPoolExecutor(max_workers=len(df_metadata)) as executor:
+        df_dict = dict(executor.map(partial(_fetch_one, cache_dir=cache_dir), df_metadata))
     return df_dict
+
+
+def _fetch_one(df_metadata_dict: dict, cache_dir: Path) -> tuple:
+    """
+    Fetch one dataset from its url if not already in the cache_dir, otherwise fetch it from the cache_dir.
+
+    Args:
+        df_metadata_dict (dict): Name, url and source format of the dataset.
+        cache_dir (Path): Directory of the parquet cache.
+
+    Returns:
+        tuple: The name of the dataset and its dataframe.
+    """
+    df_name = df_metadata_dict["df_name"]
+    # Every dataset is cached as parquet: reloading is then much faster than parsing a csv again.
+    local_path = cache_dir / f"{df_name}.v{CACHE_VERSION}.parquet"
+    if not local_path.exists():
+        if df_metadata_dict["format"] == "csv":
+            df = pl.read_csv(
+                df_metadata_dict["url"],
+                infer_schema_length=10000,
+                schema_overrides=df_metadata_dict.get("schema_overrides"),
+            )
+        else:
+            df = pl.read_parquet(df_metadata_dict["url"])
+        df = shrink_dtypes(df)
+        df.write_parquet(local_path, compression="zstd", use_pyarrow=False, statistics=True)
+    # valeur is by far the largest table: keep it lazy so that filters and column selections are pushed
+    # down to the parquet reader.
+    df = pl.scan_parquet(local_path) if df_name == "valeur" else pl.read_parquet(local_path)
+    return df_name, df
@@ -1,5 +1,5 @@
 # %%
-import pandas as pd
+import polars as pl
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
@@ -12,16 +12,24 @@ plt.style.use("default")
 sns.set_palette("husl")
 plt.rcParams["figure.figsize"] = (12, 8)
 
+# Share categoricals across datasets, so that the valeur keys are joined to the metadata names on their codes
+pl.enable_string_cache()
+
 # %%
 # Load data
 print("Loading BQSS data...")
 data_dict = fetch_bqss_data()
+# valeur is a LazyFrame: queries on it only read the rows and columns they need
 valeur_df = data_dict["valeur"]
 finess_df = data_dict["finess"]
 metadata_df = data_dict["metadata"]
+metadata_lf = metadata_df.lazy()
+# Indicator titles by name, looked up for each indicator of the reports
+name_to_title = dict(zip(metadata_df["name"], metadata_df["title"]))
+VALUE_COLS = ["value_boolean", "value_string", "value_integer", "value_float", "value_date"]
 
 print(f"Data loaded successfully!")
-print(f"Valeur dataset: {valeur_df.shape[0]:,} records")
+print(f"Valeur dataset: {valeur_df.select(pl.len()).collect().item():,} records")
 print(f"FINESS dataset: {finess_df.shape[0]:,} establishments")
 print(f"Metadata: {metadata_df.shape[0]} indicators")
 
@@ -29,18 +37,10 @@ print(f"Metadata: {metadata_df.shape[0]} indicators")
 # %%
 def get_finess_info(finess_id):
     """Get basic information about a FINESS establishment."""
-    if hasattr(finess_df, "filter"):  # Polars DataFrame
-        finess_info = finess_df.filter(finess_df["num_finess_et"] == finess_id)
-        if finess_info.height > 0:
-            info = finess_info.head(1).to_pandas().iloc[0]
-        else:
-            return None
-    else:  # Pandas DataFrame
-        finess_info = finess_df[finess_df["num_finess_et"] == finess_id]
-        if len(finess_info) > 0:
-            info = finess_info.iloc[0]
-        else:
-            return None
+    finess_info = finess_df.filter(finess_df["num_finess_et"] == finess_id)
+    if finess_info.height == 0:
+        return None
+    info = finess_info.row(0, named=True)
 
     return {
         "finess_id": finess_id,
@@ -54,21 +54,31 @@ def get_finess_info(finess_id):
 
 def get_finess_indicators(finess_id):
     """Get all indicators for a specific FINESS establishment."""
-    finess_data = valeur_df[valeur_df["finess"] == finess_id].copy()
+    # Join with metadata to get indicator titles and sources, the filter is pushed down to the parquet scan
+    finess_data = (
+        valeur_df.filter(pl.col("finess") == finess_id)
+        .join(metadata_lf.select(["name", "title", "source"]), left_on="key", right_on="name", how="left")
+        # Unified value of each indicator, whatever its type, computed for all the rows at once
+        .with_columns(
+            value=pl.coalesce([
+                pl.col("value_boolean").cast(pl.String),
+                pl.col("value_string"),
+                pl.col("value_integer").cast(pl.String),
+                pl.col("value_float").round(2).cast(pl.String),
+                pl.col("value_date").cast(pl.String),
+            ])
+        )
+        .collect()
+    )
 
-    if len(finess_data) == 0:
+    if finess_data.height == 0:
         return None
 
-    # Merge with metadata to get indicator descriptions
-    finess_data = finess_data.merge(
-        metadata_df[["name", "title", "description", "type", "source"]], left_on="key", right_on="name", how="left"
-    )
-
     return finess_data
 
 
 def create_finess_report(finess_id):
-    """Create a comprehensive report for a FINESS establishment."""
+    """Create a comprehensive report for a FINESS establishment, return its indicators and value type counts."""
 
     print(f"=" * 80)
     print(f"📊 RAPPORT DÉTAILLÉ POUR L'ÉTABLISSEMENT FINESS: {finess_id}")
@@ -78,7 +88,7 @@ def create_finess_report(finess_id):
     finess_info = get_finess_info(finess_id)
     if finess_info is None:
         print(f"❌ Établissement FINESS {finess_id} non trouvé dans la base FINESS")
-        return
+        return None, None
 
     print(f"\n🏥 INFORMATIONS GÉNÉRALES")
     print("-" * 40)
@@ -92,64 +102,54 @@ def create_finess_report(finess_id):
     finess_data = get_finess_indicators(finess_id)
     if finess_data is None or len(finess_data) == 0:
         print(f"\n❌ Aucune donnée d'indicateurs trouvée pour {finess_id}")
-        return
+        return None, None
 
     print(f"\n📈 DONNÉES DISPONIBLES")
     print("-" * 40)
     print(f"Nombre total d'enregistrements: {len(finess_data):,}")
-    print(f"Années couvertes: {sorted(finess_data['annee'].unique())}")
-    print(f"Nombre d'indicateurs uniques: {finess_data['key'].nunique()}")
-    print(f"Types FINESS: {list(finess_data['finess_type'].unique())}")
+    print(f"Années couvertes: {finess_data['annee'].unique().sort().to_list()}")
+    print(f"Nombre d'indicateurs uniques: {finess_data['key'].n_unique()}")
+    print(f"Types FINESS: {finess_data['finess_type'].unique(maintain_order=True).to_list()}")
 
     # Years analysis
     print(f"\n📅 RÉPARTITION PAR ANNÉE")
     print("-" * 40)
-    year_counts = finess_data["annee"].value_counts().sort_index()
-    for year, count in year_counts.items():
+    year_counts = finess_data["annee"].value_counts().sort("annee")
+    for year, count in year_counts.iter_rows():
         print(f"  {year}: {count:,} indicateurs")
 
     # Indicators by source
     print(f"\n🔍 INDICATEURS PAR SOURCE")
     print("-" * 40)
-    source_counts = finess_data["source"].value_counts()
-    for source, count in source_counts.items():
-        if pd.notna(source):
-            print(f"  {source}: {count:,} indicateurs")
+    source_counts = finess_data["source"].drop_nulls().value_counts(sort=True)
+    for source, count in source_counts.iter_rows():
+        print(f"  {source}: {count:,} indicateurs")
 
     # Data types analysis
     print(f"\n📊 TYPES DE DONNÉES")
     print("-" * 40)
 
-    # Count non-null values by type
-    boolean_count = finess_data["value_boolean"].notna().sum()
-    string_count = finess_data["value_string"].notna().sum()
-    integer_count = finess_data["value_integer"].notna().sum()
-    float_count = finess_data["value_float"].notna().sum()
-    date_count = finess_data["value_date"].notna().sum()
+    # Count non-null values by type, in a single pass over the value columns
+    value_counts = finess_data.select([pl.col(c).is_not_null().sum() for c in VALUE_COLS]).row(0, named=True)
 
-    print(f"  Valeurs booléennes: {boolean_count:,}")
-    print(f"  Valeurs textuelles: {string_count:,}")
-    print(f"  Valeurs entières: {integer_count:,}")
-    print(f"  Valeurs décimales: {float_count:,}")
-    print(f"  Valeurs dates: {date_count:,}")
+    print(f"  Valeurs booléennes: {value_counts['value_boolean']:,}")
+    print(f"  Valeurs textuelles: {value_counts['value_string']:,}")
+    print(f"  Valeurs entières: {value_counts['value_integer']:,}")
+    print(f"  Valeurs décimales: {value_counts['value_float']:,}")
+    print(f"  Valeurs dates: {value_counts['value_date']:,}")
 
     # Top indicators
     print(f"\n🏆 TOP 10 DES INDICATEURS LES PLUS FRÉQUENTS")
     print("-" * 40)
-    top_indicators = finess_data["key"].value_counts().head(10)
-    for i, (indicator, count) in enumerate(top_indicators.items(), 1):
-        # Get indicator title
-        title = (
-            metadata_df[metadata_df["name"] == indicator]["title"].iloc[0]
-            if indicator in metadata_df["name"].values
-            else indicator
-        )
+    top_indicators = finess_data["key"].value_counts(sort=True).head(10)
+    for i, (indicator, count) in enumerate(top_indicators.iter_rows(), 1):
+        title = name_to_title.get(indicator, indicator)
         print(f"  {i:2d}. {title[:60]}{'...' if len(title) > 60 else ''}")
         print(f"      ({count} enregistrements)")
 
     # Recent indicators (last year available)
     latest_year = finess_data["annee"].max()
-    recent_data = finess_data[finess_data["annee"] == latest_year]
+    recent_data = finess_data.filter(pl.col("annee") == latest_year)
 
     print(f"\n📋 INDICATEURS RÉCENTS ({latest_year})")
     print("-" * 40)
@@ -157,44 +157,33 @@ def create_finess_report(finess_id):
 
     if len(recent_data) > 0:
         # Show some sample recent indicators with values
-        sample_recent = recent_data.head(10)
-        for _, row in sample_recent.iterrows():
-            title = row["title"] if pd.notna(row["title"]) else row["key"]
-
-            # Get the actual value
-            value = None
-            if pd.notna(row["value_boolean"]):
-                value = row["value_boolean"]
-            elif pd.notna(row["value_string"]):
-                value = row["value_string"]
-            elif pd.notna(row["value_integer"]):
-                value = row["value_integer"]
-            elif pd.notna(row["value_float"]):
-                value = row["value_float"]
-            elif pd.notna(row["value_date"]):
-                value = row["value_date"]
-            else:
-                value = "Valeur manquante"
-
+        sample_recent = recent_data.head(10).select(
+            pl.coalesce("title", "key"), pl.col("value").fill_null("Valeur manquante")
+        )
+        for title, value in sample_recent.iter_rows():
             print(f"  • {title[:50]}{'...' if len(title) > 50 else ''}: {value}")
 
-    return finess_data
+    return finess_data, value_counts
 
 
 # %%
 # Get a sample FINESS ID to demonstrate
 print("🔍 Recherche d'un établissement exemple...")
-sample_finess = valeur_df["finess"].value_counts().head(1).index[0]
+# Top 5 establishments by number of indicators, reused for the comparison report below
+top_finess = (
+    valeur_df.group_by("finess").len().top_k(5, by="len").sort("len", descending=True).collect()["finess"].to_list()
+)
+sample_finess = top_finess[0]
 print(f"Utilisation de l'établissement exemple: {sample_finess}")
 
 # %%
 # Create report for sample establishment
-sample_report = create_finess_report(sample_finess)
+sample_report, sample_value_counts = create_finess_report(sample_finess)
 
 
 # %%
-def create_visualizations(finess_id, finess_data):
-    """Create visualizations for the FINESS establishment."""
+def create_visualizations(finess_id, finess_data, value_counts):
+    """Create visualizations for the FINESS establishment, from the value type counts computed by the report."""
 
     if finess_data is None or len(finess_data) == 0:
         print("Aucune donnée à visualiser")
@@ -208,21 +197,16 @@ def create_visualizations(finess_id, finess_data):
     fig.suptitle(f"Analyse des indicateurs pour FINESS {finess_id}", fontsize=16, fontweight="bold")
 
     # 1. Evolution over years
-    year_counts = finess_data["annee"].value_counts().sort_index()
-    axes[0, 0].bar(year_counts.index, year_counts.values, color="skyblue", alpha=0.7)
+    year_counts = finess_data["annee"].value_counts().sort("annee")
+    bars = axes[0, 0].bar(year_counts["annee"], year_counts["count"], color="skyblue", alpha=0.7)
+    axes[0, 0].bar_label(bars, padding=3)
     axes[0, 0].set_title("Nombre d'indicateurs par année")
     axes[0, 0].set_xlabel("Année")
     axes[0, 0].set_ylabel("Nombre d'indicateurs")
     axes[0, 0].tick_params(axis="x", rotation=45)
 
     # 2. Data types distribution
-    data_types = {
-        "Booléen": finess_data["value_boolean"].notna().sum(),
-        "Texte": finess_data["value_string"].notna().sum(),
-        "Entier": finess_data["value_integer"].notna().sum(),
-        "Décimal": finess_data["value_float"].notna().sum(),
-        "Date": finess_data["value_date"].notna().sum(),
-    }
+    data_types = dict(zip(["Booléen", "Texte", "Entier", "Décimal", "Date"], (value_counts[c] for c in VALUE_COLS)))
 
     # Remove zero values for pie chart
     data_types = {k: v for k, v in data_types.items() if v > 0}
@@ -232,18 +216,24 @@ def create_visualizations(finess_id, finess_data):
         axes[0, 1].set_title("Répartition des types de données")
 
     # 3. Sources distribution
-    source_counts = finess_data["source"].value_counts()
+    source_counts = finess_data["source"].drop_nulls().value_counts(sort=True)
     if len(source_counts) > 0:
-        axes[1, 0].barh(range(len(source_counts)), source_counts.values, color="lightcoral", alpha=0.7)
+        bars = axes[1, 0].barh(range(len(source_counts)), source_counts["count"], color="lightcoral", alpha=0.7)
+        axes[1, 0].bar_label(bars, padding=3)
         axes[1, 0].set_yticks(range(len(source_counts)))
-        axes[1, 0].set_yticklabels([str(s)[:20] + "..." if len(str(s)) > 20 else str(s) for s in source_counts.index])
+        axes[1, 0].set_yticklabels([
+            str(s)[:20] + "..." if len(str(s)) > 20 else str(s) for s in source_counts["source"]
+        ])
         axes[1, 0].set_title("Indicateurs par source")
         axes[1, 0].set_xlabel("Nombre d'indicateurs")
 
     # 4. FINESS type distribution
-    finess_type_counts = finess_data["finess_type"].value_counts()
+    finess_type_counts = finess_data["finess_type"].drop_nulls().value_counts(sort=True)
     if len(finess_type_counts) > 0:
-        axes[1, 1].bar(finess_type_counts.index, finess_type_counts.values, color="lightgreen", alpha=0.7)
+        bars = axes[1, 1].bar(
+            finess_type_counts["finess_type"], finess_type_counts["count"], color="lightgreen", alpha=0.7
+        )
+        axes[1, 1].bar_label(bars, padding=3)
         axes[1, 1].set_title("Répartition par type FINESS")
         axes[1, 1].set_xlabel("Type FINESS")
         axes[1, 1].set_ylabel("Nombre d'indicateurs")
@@ -255,7 +245,7 @@ def create_visualizations(finess_id, finess_data):
 # %%
 # Create visualizations for the sample establishment
 if sample_report is not None:
-    create_visualizations(sample_finess, sample_report)
+    create_visualizations(sample_finess, sample_report, sample_value_counts)
 
 
 # %%
@@ -265,41 +255,22 @@ def analyze_indicator_trends(finess_id, finess_data, indicator_key):
     if finess_data is None:
         return
 
-    indicator_data = finess_data[finess_data["key"] == indicator_key]
+    indicator_data = finess_data.filter(pl.col("key") == indicator_key)
 
     if len(indicator_data) == 0:
         print(f"Aucune donnée trouvée pour l'indicateur: {indicator_key}")
         return
 
-    # Get indicator info
-    indicator_info = metadata_df[metadata_df["name"] == indicator_key]
-    indicator_title = indicator_info["title"].iloc[0] if len(indicator_info) > 0 else indicator_key
+    indicator_title = name_to_title.get(indicator_key, indicator_key)
 
     print(f"\n📈 ÉVOLUTION DE L'INDICATEUR: {indicator_title}")
     print("-" * 60)
 
     # Sort by year
-    indicator_data = indicator_data.sort_values("annee")
-
-    # Display evolution
-    for _, row in indicator_data.iterrows():
-        year = row["annee"]
-
-        # Get the value
-        value = None
-        if pd.notna(row["value_boolean"]):
-            value = row["value_boolean"]
-        elif pd.notna(row["value_string"]):
-            value = row["value_string"]
-        elif pd.notna(row["value_integer"]):
-            value = row["value_integer"]
-        elif pd.notna(row["value_float"]):
-            value = f"{row['value_float']:.2f}"
-        elif pd.notna(row["value_date"]):
-            value = row["value_date"]
-        else:
-            value = "N/A"
+    indicator_data = indicator_data.sort("annee")
 
+    # Display evolution, only the year and value columns are iterated
+    for year, value in indicator_data.select("annee", pl.col("value").fill_null("N/A")).iter_rows():
         print(f"  {year}: {value}")
 
 
@@ -307,7 +278,7 @@ def analyze_indicator_trends(finess_id, finess_data, indicator_key):
 # Analyze trends for a specific indicator (if available)
 if sample_report is not None and len(sample_report) > 0:
     # Get the most frequent indicator for this establishment
-    top_indicator = sample_report["key"].value_counts().index[0]
+    top_indicator = sample_report["key"].value_counts(sort=True)["key"][0]
     analyze_indicator_trends(sample_finess, sample_report, top_indicator)
 
 
@@ -320,46 +291,64 @@ def create_comparison_report(finess_list):
     print(f"📊 RAPPORT COMPARATIF POUR {len(finess_list)} ÉTABLISSEMENTS")
     print(f"{'=' * 80}")
 
-    comparison_data = []
-
-    for finess_id in finess_list:
-        finess_info = get_finess_info(finess_id)
-        finess_data = get_finess_indicators(finess_id)
-
-        if finess_info and finess_data is not None:
-            comparison_data.append({
-                "finess_id": finess_id,
-                "nom": finess_info["nom"],
-                "commune": finess_info["commune"],
-                "categorie": finess_info["categorie"],
-                "nb_indicateurs": len(finess_data),
-                "annees_min": finess_data["annee"].min(),
-                "annees_max": finess_data["annee"].max(),
-                "nb_sources": finess_data["source"].nunique(),
-            })
-
-    if comparison_data:
-        comparison_df = pd.DataFrame(comparison_data)
+    # One lazy query aggregates the indicators of all the establishments and joins their FINESS information
+    comparison_df = (
+        valeur_df.filter(pl.col("finess").is_in(finess_list))
+        .join(metadata_lf.select(["name", "source"]), left_on="key", right_on="name", how="left")
+        .group_by("finess")
+        .agg(
+            pl.len().alias("nb_indicateurs"),
+            pl.col("annee").min().alias("annees_min"),
+            pl.col("annee").max().alias("annees_max"),
+            pl.col("source").drop_nulls().n_unique().alias("nb_sources"),
+        )
+        .join(
+            finess_df.lazy()
+            .filter(pl.col("num_finess_et").is_in(finess_list))
+            .select(
+                "num_finess_et",
+                pl.col("raison_sociale_et").alias("nom"),
+                "commune",
+                pl.col("libelle_categorie_et").alias("categorie"),
+            ),
+            left_on="finess",
+            right_on="num_finess_et",
+            how="left",
+        )
+        # Establishments missing from FINESS are kept in the comparison, with N/A names
+        .with_columns(pl.col(["nom", "commune", "categorie"]).fill_null("N/A"))
+        .select(
+            pl.col("finess").alias("finess_id"),
+            "nom",
+            "commune",
+            "categorie",
+            "nb_indicateurs",
+            "annees_min",
+            "annees_max",
+            "nb_sources",
+        )
+        .sort("nb_indicateurs", descending=True)
+        .collect()
+    )
 
+    if comparison_df.height > 0:
         print("\n📋 TABLEAU COMPARATIF")
         print("-" * 80)
-        print(comparison_df.to_string(index=False))
+        print(comparison_df.to_pandas().to_string(index=False))
 
         # Summary statistics
         print(f"\n📊 STATISTIQUES COMPARATIVES")
         print("-" * 40)
         print(f"Nombre moyen d'indicateurs: {comparison_df['nb_indicateurs'].mean():.1f}")
-        print(
-            f"Établissement avec le plus d'indicateurs: {comparison_df.loc[comparison_df['nb_indicateurs'].idxmax(), 'nom']}"
-        )
+        top_row = comparison_df.row(comparison_df["nb_indicateurs"].arg_max(), named=True)
+        print(f"Établissement avec le plus d'indicateurs: {top_row['nom']} ({top_row['finess_id']})")
         print(f"  → {comparison_df['nb_indicateurs'].max():,} indicateurs")
 
 
 # %%
 # Get top 5 establishments by number of indicators for comparison
 print("🔍 Création d'un rapport comparatif...")
-top_establishments = valeur_df["finess"].value_counts().head(5).index.tolist()
-create_comparison_report(top_establishments)
+create_comparison_report(top_finess)
 
 # %%
 print(f"\n{'=' * 80}")